@@ -15,7 +15,6 @@ st.set_page_config(
 SPREADSHEET_ID = '1jk-I4DZg2VXQnB8q6te-ylR14Ht48l6EsoYhlmrXGBg'
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 SHEET_NAME = 'Sheet1'
-SERVICE_ACCOUNT_FILE = dict(st.secrets["gcp_service_account"])
 
 # ---------- AUTH ----------
 def check_login():
@@ -53,56 +52,296 @@ def logout():
 @st.cache_resource
 def init_gsheet():
     try:
-        creds = Credentials.from_service_account_info(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-        service = build('sheets', 'v4', credentials=creds)
+        service_account_info = dict(st.secrets["gcp_service_account"])
+        creds = Credentials.from_service_account_info(service_account_info, scopes=SCOPES)
+        service = build('sheets', 'v4', credentials=creds, cache_discovery=False)
         return service
     except Exception as e:
         st.error(f"Error connecting to Google Sheets: {str(e)}")
         return None
 
-def get_sheet_data(service, range_name='Sheet1!A:F'):
+@st.cache_resource
+def get_sheet_id(spreadsheet_id, sheet_name):
+    # Structural requests address tabs by sheetId, value ranges by name
+    result = init_gsheet().spreadsheets().get(
+        spreadsheetId=spreadsheet_id, fields='sheets.properties'
+    ).execute()
+    for sheet in result.get('sheets', []):
+        if sheet['properties']['title'] == sheet_name:
+            return sheet['properties']['sheetId']
+    raise ValueError(f"Sheet '{sheet_name}' not found")
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_sheet_values(spreadsheet_id, range_name):
+    result = init_gsheet().spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id, range=range_name
+    ).execute()
+    return result.get('values', [])
+
+def get_sheet_data(range_name='Sheet1!A:F'):
     try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID, range=range_name
-        ).execute()
-        return result.get('values', [])
+        return _cached_sheet_values(SPREADSHEET_ID, range_name)
     except Exception as e:
         st.error(f"Error getting sheet data: {str(e)}")
         return []
 
+def batch_update_sheet_data(service, data):
+    # data: list of {'range': ..., 'values': ...} written in one request
+    try:
+        service.spreadsheets().values().batchUpdate(
+            spreadsheetId=SPREADSHEET_ID,
+            body={'valueInputOption': 'USER_ENTERED', 'data': data}
+        ).execute()
+        _cached_sheet_values.clear()
+        return True
+    except Exception as e:
+        st.error(f"Error updating sheet: {str(e)}")
+        return False
+
 def update_sheet_data(service, values, range_name='Sheet1!A:F'):
+    return batch_update_sheet_data(service, [{'range': range_name, 'values': values}])
+
+def append_sheet_row(service, row, range_name='Sheet1!A:F'):
     try:
-        body = {'values': values}
-        service.spreadsheets().values().update(
+        service.spreadsheets().values().append(
             spreadsheetId=SPREADSHEET_ID,
             range=range_name,
             valueInputOption='USER_ENTERED',
-            body=body
+            insertDataOption='INSERT_ROWS',
+            body={'values': [row]}
         ).execute()
+        _cached_sheet_values.clear()
         return True
     except Exception as e:
-        st.error(f"Error updating sheet: {str(e)}")
+        st.error(f"Error adding expense: {str(e)}")
+        return False
+
+def insert_sheet_row(service, row, row_index, num_rows):
+    # Open an empty row at the sorted position and renumber Sl No in the same
+    # batchUpdate, then fill the row with USER_ENTERED so the cells are stored
+    # exactly like rows added by append_sheet_row
+    try:
+        sheet_id = get_sheet_id(SPREADSHEET_ID, SHEET_NAME)
+        requests = [
+            {
+                'insertDimension': {
+                    'range': {
+                        'sheetId': sheet_id,
+                        'dimension': 'ROWS',
+                        'startIndex': row_index,
+                        'endIndex': row_index + 1
+                    },
+                    'inheritFromBefore': row_index > 1
+                }
+            },
+            {
+                'repeatCell': {
+                    'range': {
+                        'sheetId': sheet_id,
+                        'startRowIndex': 1,
+                        'endRowIndex': num_rows + 1,
+                        'startColumnIndex': 0,
+                        'endColumnIndex': 1
+                    },
+                    'cell': {'userEnteredValue': {'formulaValue': '=ROW()-1'}},
+                    'fields': 'userEnteredValue'
+                }
+            }
+        ]
+        service.spreadsheets().batchUpdate(
+            spreadsheetId=SPREADSHEET_ID,
+            body={'requests': requests}
+        ).execute()
+        _cached_sheet_values.clear()
+    except Exception as e:
+        st.error(f"Error adding expense: {str(e)}")
+        return False
+    sheet_row = row_index + 1
+    if update_sheet_data(service, [row], f'Sheet1!A{sheet_row}:F{sheet_row}'):
+        return True
+    # Don't leave the opened row behind as an empty expense
+    if not delete_sheet_rows(service, [row_index]):
+        st.error(f"Row {sheet_row} was opened for the new expense but could not be filled or removed.")
+    return False
+
+def delete_sheet_rows(service, row_indices):
+    # Delete bottom-up so the remaining indices stay valid
+    try:
+        sheet_id = get_sheet_id(SPREADSHEET_ID, SHEET_NAME)
+        requests = [
+            {
+                'deleteDimension': {
+                    'range': {
+                        'sheetId': sheet_id,
+                        'dimension': 'ROWS',
+                        'startIndex': i,
+                        'endIndex': i + 1
+                    }
+                }
+            }
+            for i in sorted(row_indices, reverse=True)
+        ]
+        service.spreadsheets().batchUpdate(
+            spreadsheetId=SPREADSHEET_ID,
+            body={'requests': requests}
+        ).execute()
+        _cached_sheet_values.clear()
+        return True
+    except Exception as e:
+        st.error(f"Error deleting rows: {str(e)}")
         return False
 
 # ---------- SORTING ----------
-def sort_data(all_data, newest_first=True):
-    if len(all_data) <= 1:
-        return all_data
-    headers = all_data[0]
-    data_rows = all_data[1:]
-    def parse_date(date_str):
-        try:
-            return datetime.strptime(str(date_str), '%d/%m/%Y')
-        except:
-            return datetime.min
-    sorted_rows = sorted(
-        data_rows,
-        key=lambda row: parse_date(row[1]) if len(row) > 1 else datetime.min,
-        reverse=newest_first
-    )
-    for i, row in enumerate(sorted_rows, 1):
-        row[0] = i
-    return [headers] + sorted_rows
+def sort_sheet(service, num_rows, newest_first=True):
+    # Sort server-side, then renumber Sl No so it follows the new row order
+    try:
+        sheet_id = get_sheet_id(SPREADSHEET_ID, SHEET_NAME)
+        requests = [
+            {
+                'sortRange': {
+                    'range': {
+                        'sheetId': sheet_id,
+                        'startRowIndex': 1,
+                        'startColumnIndex': 0,
+                        'endColumnIndex': 6
+                    },
+                    'sortSpecs': [{
+                        'dimensionIndex': 1,
+                        'sortOrder': 'DESCENDING' if newest_first else 'ASCENDING'
+                    }]
+                }
+            },
+            {
+                'repeatCell': {
+                    'range': {
+                        'sheetId': sheet_id,
+                        'startRowIndex': 1,
+                        'endRowIndex': num_rows,
+                        'startColumnIndex': 0,
+                        'endColumnIndex': 1
+                    },
+                    'cell': {'userEnteredValue': {'formulaValue': '=ROW()-1'}},
+                    'fields': 'userEnteredValue'
+                }
+            }
+        ]
+        service.spreadsheets().batchUpdate(
+            spreadsheetId=SPREADSHEET_ID,
+            body={'requests': requests}
+        ).execute()
+        _cached_sheet_values.clear()
+        st.session_state.sort_newest_first = newest_first
+        return True
+    except Exception as e:
+        st.error(f"Error sorting sheet: {str(e)}")
+        return False
+
+def sorted_insert_index(all_data, new_date, newest_first=None):
+    # Data row position that keeps the sheet sorted, or None if it isn't sorted.
+    # The last sort direction is tried first; otherwise it is read from the data
+    dates = parse_dates(pd.Series([row[1] if len(row) > 1 else '' for row in all_data[1:]]))
+    new_date = pd.Timestamp(new_date)
+    directions = [False, True] if newest_first is None else [newest_first, not newest_first]
+    for descending in directions:
+        if descending and dates.is_monotonic_decreasing:
+            return len(dates) - int(dates[::-1].searchsorted(new_date, side='left'))
+        if not descending and dates.is_monotonic_increasing:
+            return int(dates.searchsorted(new_date, side='right'))
+    return None
+
+# ---------- DATES ----------
+def parse_dates(dates):
+    # Stored as ISO yyyy-mm-dd; older rows may still be dd/mm/yyyy
+    parsed = pd.to_datetime(dates, format='ISO8601', errors='coerce')
+    legacy = pd.to_datetime(dates, format='%d/%m/%Y', errors='coerce')
+    return parsed.fillna(legacy)
+
+def format_dates(dates):
+    return pd.to_datetime(dates).dt.strftime('%Y-%m-%d').fillna('')
+
+# ---------- EDITING ----------
+def edited_cell_updates(values, changes, num_rows):
+    # Turn the data_editor delta into value ranges for the cells that changed
+    columns = list(values.columns)
+    data = []
+    for row_idx, cols in changes["edited_rows"].items():
+        row_idx = int(row_idx)
+        if row_idx not in values.index:
+            continue
+        for col in cols:
+            col_letter = chr(ord('A') + columns.index(col))
+            data.append({
+                'range': f"Sheet1!{col_letter}{row_idx + 2}",
+                'values': [[values.at[row_idx, col]]]
+            })
+    num_added = len(changes["added_rows"])
+    if num_added:
+        added = values.iloc[len(values) - num_added:].copy()
+        added["Sl No"] = '=ROW()-1'
+        data.append({
+            'range': f"Sheet1!A{num_rows + 1}",
+            'values': added.values.tolist()
+        })
+    return data
+
+# ---------- ADD EXPENSE ----------
+@st.fragment
+def add_expense_form(service, all_data, items, vendors):
+    st.subheader("Add New Expense")
+
+    with st.form("expense_form", clear_on_submit=True):
+        expense_date = st.date_input("Date", value=datetime.now().date())
+
+        # --- Item Description ---
+        item_options = (items if items else [])
+        desc_suggestion = st.selectbox(
+            "Item Description",
+            options=item_options,
+            key="desc_select",
+            accept_new_options=True
+        )
+
+        description = desc_suggestion
+
+        # --- Vendor ---
+        vendor_options = (vendors if vendors else [])
+        vendor_suggestion = st.selectbox(
+            "Vendor",
+            options=vendor_options,
+            key="vendor_select"
+        )
+
+        vendor = vendor_suggestion
+
+        # --- Other fields ---
+        bill_number = st.text_input("Bill Number")
+        amount = st.number_input("Amount (₹)", min_value=0.0, step=0.01, format="%.2f")
+
+        # --- Submit ---
+        submitted = st.form_submit_button("Add Expense", use_container_width=True, type="primary")
+
+        if submitted:
+            if description and vendor and amount > 0:
+                new_row = [
+                    '=ROW()-1',
+                    expense_date.isoformat(),
+                    description.strip(),
+                    vendor.strip(),
+                    bill_number if bill_number else "N/A",
+                    amount
+                ]
+                # Keep the sheet in whichever date order it is in
+                newest_first = st.session_state.get('sort_newest_first')
+                insert_at = sorted_insert_index(all_data, expense_date, newest_first)
+                if insert_at is not None:
+                    added = insert_sheet_row(service, new_row, insert_at + 1, len(all_data))
+                else:
+                    added = append_sheet_row(service, new_row)
+                if added:
+                    st.success("✅ Expense added successfully!")
+                    st.rerun()
+            else:
+                st.warning("⚠️ Please fill all required fields.")
 
 # ---------- MAIN APP ----------
 def expense_tracker_app():
@@ -118,101 +357,73 @@ def expense_tracker_app():
     if service is None:
         return
 
-    all_data = get_sheet_data(service)
+    all_data = get_sheet_data()
     if not all_data:
         headers = ['Sl No', 'Date', 'Item Description', 'Vendor', 'Bill Number', 'Amount']
         update_sheet_data(service, [headers])
         all_data = [headers]
 
     # Suggestions for autocomplete
-    vendors = list(set([row[3] for row in all_data[1:] if len(row) > 3]))
-    items = list(set([row[2] for row in all_data[1:] if len(row) > 2]))
+    vendors = list(dict.fromkeys(row[3] for row in all_data[1:] if len(row) > 3 and row[3]))
+    items = list(dict.fromkeys(row[2] for row in all_data[1:] if len(row) > 2 and row[2]))
 
     col1, col2 = st.columns([1, 2])
     # ---------- ADD EXPENSE ----------
     with col1:
-        st.subheader("Add New Expense")
-
-        with st.form("expense_form", clear_on_submit=True):
-            expense_date = st.date_input("Date", value=datetime.now().date())
-
-            # --- Item Description ---
-            item_options = (items if items else [])
-            desc_suggestion = st.selectbox(
-                "Item Description",
-                options=item_options,
-                key="desc_select",
-                accept_new_options=True
-            )
-
-            description = desc_suggestion
-
-            # --- Vendor ---
-            vendor_options = (vendors if vendors else [])
-            vendor_suggestion = st.selectbox(
-                "Vendor",
-                options=vendor_options,
-                key="vendor_select"
-            )
-
-            vendor = vendor_suggestion
-
-            # --- Other fields ---
-            bill_number = st.text_input("Bill Number")
-            amount = st.number_input("Amount (₹)", min_value=0.0, step=0.01, format="%.2f")
-
-            # --- Submit ---
-            submitted = st.form_submit_button("Add Expense", use_container_width=True, type="primary")
-
-            if submitted:
-                if description and vendor and amount > 0:
-                    new_row = [
-                        len(all_data),
-                        expense_date.strftime('%d/%m/%Y'),
-                        description.strip(),
-                        vendor.strip(),
-                        bill_number if bill_number else "N/A",
-                        amount
-                    ]
-                    all_data.append(new_row)
-                    all_data = sort_data(all_data, newest_first=False)
-                    update_sheet_data(service, all_data)
-                    st.success("✅ Expense added successfully!")
-                    st.rerun()
-                else:
-                    st.warning("⚠️ Please fill all required fields.")
+        add_expense_form(service, all_data, items, vendors)
 
     # ---------- VIEW & EDIT ----------
     with col2:
         st.subheader("Expenses")
         sort_col1, sort_col2 = st.columns([1,1])
         if sort_col1.button("⬆️ Oldest → Newest"):
-            all_data = sort_data(all_data, newest_first=False)
-            update_sheet_data(service, all_data)
-            st.rerun()
+            if sort_sheet(service, len(all_data), newest_first=False):
+                st.rerun()
         if sort_col2.button("⬇️ Newest → Oldest"):
-            all_data = sort_data(all_data, newest_first=True)
-            update_sheet_data(service, all_data)
-            st.rerun()
+            if sort_sheet(service, len(all_data), newest_first=True):
+                st.rerun()
 
         if len(all_data) > 1:
             df = pd.DataFrame(all_data[1:], columns=all_data[0])
+            df["Date"] = parse_dates(df["Date"]).dt.date
+            numeric_cols = ["Sl No", "Amount"]
+            df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors="coerce")
 
             # ---- SUMMARY ----
             num_entries = len(df)
-            total_expenses = pd.to_numeric(df["Amount"], errors="coerce").sum()
+            total_expenses = df["Amount"].sum()
 
             st.markdown("### 📊 Summary")
             col_a, col_b = st.columns(2)
             col_a.metric("Number of Entries", num_entries)
             col_b.metric("Total Expenses (₹)", f"{total_expenses:,.2f}")
 
-            edited_df = st.data_editor(df, num_rows="dynamic", use_container_width=True)
+            edited_df = st.data_editor(
+                df,
+                num_rows="dynamic",
+                use_container_width=True,
+                key="expense_editor",
+                disabled=["Sl No"],
+                column_config={
+                    "Date": st.column_config.DateColumn("Date", format="DD/MM/YYYY"),
+                    "Amount": st.column_config.NumberColumn("Amount", format="₹%.2f")
+                }
+            )
             if st.button("💾 Save Changes", type="primary", use_container_width=True):
-                new_values = [all_data[0]] + edited_df.values.tolist()
-                update_sheet_data(service, new_values)
-                st.success("✅ Changes saved!")
-                st.rerun()
+                edited_df["Date"] = format_dates(edited_df["Date"])
+                # Missing values in any column are written as "" so cleared cells
+                # are actually cleared (None is skipped by Sheets, NaN isn't valid JSON)
+                sheet_values = edited_df.astype(object).where(edited_df.notna(), "")
+                changes = st.session_state["expense_editor"]
+                updates = edited_cell_updates(sheet_values, changes, len(all_data))
+                saved = True
+                if updates:
+                    saved = batch_update_sheet_data(service, updates)
+                if saved and changes["deleted_rows"]:
+                    saved = delete_sheet_rows(service, [i + 1 for i in changes["deleted_rows"]])
+                if saved:
+                    st.success("✅ Changes saved!")
+                    st.rerun()
         else:
             st.info("No expenses recorded yet.")
 